@@ -1,26 +1,82 @@
 import serial
+import sys
 import threading
 import time
 import re
+import fcntl
+import selectors
 import json
-from collections import deque
-from datetime import datetime
+import hashlib
+import os
+import queue
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timedelta
+
+# Per-line events fused into one alternation, dispatched on m.lastgroup:
+#   reset - exactly this line (start of TF-A boot)
+#   boot  - U-Boot hands over to the application
+#   crash - start of a crash dump
+# Patterns are bytes so raw serial lines are matched without decoding.
+RE_EVENTS = re.compile(
+    rb'(?P<reset>^NOTICE:\s+CPU:\s+STM32MP257FAI\s+Rev\.Y\b)'
+    rb'|(?P<boot>^## Starting application at 0x88000040\b)'
+    rb'|(?P<crash>(?i:Synchronous Abort|Undefined Instruction|Exception))'
+)
+
+# One crash_db record; converted to a plain dict only when written to disk
+CrashEntry = namedtuple(
+    "CrashEntry",
+    "timestamp run_id complete esr elr lr prev_instructions "
+    "faulting_instruction raw_dump",
+)
+
+
+def _load_entries(d):
+    # run_id -> dict as stored on disk  =>  run_id -> CrashEntry
+    return {k: CrashEntry._make(v.get(f) for f in CrashEntry._fields)
+            for k, v in d.items()}
+
+
+HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+# Bytes drained per os.read(); a multiple of the kernel tty buffer
+READ_CHUNK = 8192
+
+# Fold the journal into crash_db.json after this many journaled crashes, so
+# a monitor that is never stop()ped still keeps both files bounded
+JOURNAL_COMPACT_EVERY = 50
+
+# Upper bound on captured crash-dump lines; a dump whose "Code:" line never
+# arrives (garbled UART) keeps only its most recent lines
+MAX_CRASH_LINES = 1024
 
-# Exactly this line (start of TF-A boot)
-RE_CPU_RESET = re.compile(r'^NOTICE:\s+CPU:\s+STM32MP257FAI\s+Rev\.Y\b')
-RE_BOOT_FINISHED = re.compile(r'^## Starting application at 0x88000040\b')
+RE_ESR = re.compile(r"esr\s*(0x[0-9A-Fa-fA-F]+)")
 
-RE_CRASH_START = re.compile(r"(Synchronous Abort|Undefined Instruction|Exception)", re.I)
-RE_CRASH_END = re.compile(r"^Code: .* \(.*\)")
 
-RE_ELR = re.compile(r"elr:\s*([0-9A-Fa-fx]+)")
-RE_LR  = re.compile(r"lr\s*:\s*([0-9A-Fa-fx]+)")
-RE_ESR = re.compile(r"esr\s*(0x[0-9A-Fa-fA-F]+)")
+def _is_crash_end(line):
+    # b"Code: aaaaaaaa ... (eeeeeeee)" terminates a crash dump
+    return line.startswith(b"Code: ") and b")" in line.partition(b" (")[2]
+
+
+def _field(line, key):
+    # First token after "<key>:" / "<key> :" where key starts the line or
+    # follows whitespace, so "lr" never matches inside "elr:".
+    # e.g. "elr: 0000000011fdb238 lr : 0000000011fdbad0", "lr : ffff8000..."
+    i = line.find(key)
+    while i != -1:
+        if i == 0 or line[i - 1].isspace():
+            rest = line[i + len(key):].lstrip()
+            if rest.startswith(":"):
+                tokens = rest[1:].split(None, 1)
+                if tokens:
+                    return tokens[0]
+        i = line.find(key, i + 1)
+    return None
 
 
 class SerialMonitor:
     def __init__(self, port="/dev/ttyACM2", baud=115200, max_log=5000,
-                 crash_db_path="crash_db.json"):
+                 crash_db_path="crash_db.json", max_crashes=1000):
         self.port = port
         self.baud = baud
 
@@ -30,23 +86,48 @@ class SerialMonitor:
 
         # State
         self.state = "unknown"   # booting / running / unknown
-        self.log_buffer = deque(maxlen=max_log)
+        # Log ring buffer: only the reader thread writes; _head counts every
+        # line ever appended and _log_start marks the last reset
+        if max_log < 1:
+            raise ValueError(f"max_log must be at least 1, got {max_log}")
+        self.max_log = max_log
+        self._logs = [None] * max_log
+        self._head = 0
+        self._log_start = 0
 
         # Crash capture
         self.crash_active = False
-        self.crash_temp = []
+        self.crash_temp = deque(maxlen=MAX_CRASH_LINES)
         self.last_crash = []
 
+        # Wall-clock anchor for crash timestamps; later times are derived
+        # from the monotonic clock so NTP jumps don't reorder crashes
+        self._t0_mono = time.monotonic_ns()
+        self._t0_wall = datetime.now()
+
         # Run tracking
         self.run_id = None
         self.run_counter = 0  # increments each boot
 
         # Crash database
         self.crash_db_path = crash_db_path
-        self.crash_db = {}  # run_id -> crash info
-
-        # Thread handle
+        self.crash_db = OrderedDict()  # run_id -> crash info, oldest first
+        self.max_crashes = max_crashes
+        self._db_queue = queue.Queue()
+        self._db_lock = threading.Lock()
+        self._last_db_hash = None  # (path, digest) of the last snapshot written
+        self._journal_count = 0  # records journaled since the last save_db()
+
+        # Thread handles
         self.thread = None
+        self.writer = None
+
+        # Partial line carried over between serial reads
+        self._rxbuf = bytearray()
+
+        # Lines waiting to be echoed to stdout when print_enabled
+        self._print_pending = []
+        self._last_print_flush = time.monotonic()
 
     # ---------------- Public API ----------------
     def start(self):
@@ -54,11 +135,20 @@ class SerialMonitor:
             self.running = True
             self.thread = threading.Thread(target=self._thread_loop, daemon=True)
             self.thread.start()
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self.writer.start()
 
     def stop(self):
         self.running = False
         if self.thread:
             self.thread.join()
+        if self.writer:
+            self._db_queue.put(None)
+            self.writer.join()
+            self.writer = None
+            # compact the journal into crash_db.json
+            self.save_db()
 
     def set_print(self, enabled: bool):
         self.print_enabled = enabled
@@ -70,39 +160,105 @@ class SerialMonitor:
         return list(self.last_crash)
 
     def get_logs(self):
-        return list(self.log_buffer)
+        return self.get_logs_since(0)[0]
+
+    def get_logs_since(self, last_seen):
+        """Return (lines, cursor) for log lines appended after last_seen.
+
+        Pass the returned cursor back in to poll for new lines only.
+        """
+        head = self._head
+        start = max(last_seen, self._log_start, head - self.max_log)
+        if start >= head:
+            return [], head
+        i, j = start % self.max_log, head % self.max_log
+        if i < j:
+            chunk = self._logs[i:j]
+        else:
+            chunk = self._logs[i:] + self._logs[:j]
+        # The reader thread may have wrapped around onto the oldest slots
+        # while we were slicing; drop those so the result stays in order
+        overwritten = self._head - self.max_log - start
+        if overwritten > 0:
+            del chunk[:overwritten]
+        return [l.decode(errors="ignore") for l in chunk], head
 
     def set_run_id(self, rid: str):
         self.run_id = rid
 
+    # Append-only journal of crashes since the last save_db(), and an
+    # append-only archive of crashes evicted from crash_db; both follow the
+    # current crash_db_path
+    @property
+    def crash_log_path(self):
+        if not self.crash_db_path:
+            return None
+        return os.path.splitext(self.crash_db_path)[0] + ".jsonl"
+
+    @property
+    def crash_archive_path(self):
+        if not self.crash_db_path:
+            return None
+        return os.path.splitext(self.crash_db_path)[0] + "_archive.jsonl"
+
     def save_db(self):
+        """Write the full crash_db snapshot and truncate the journal."""
         if not self.crash_db_path:
             return
-        with open(self.crash_db_path, "w") as f:
-            json.dump(self.crash_db, f, indent=2)
+        # Snapshot under the journal lock: a crash journaled after the
+        # snapshot is taken must not be truncated away below
+        with self._db_lock:
+            snapshot = {k: v._asdict() for k, v in list(self.crash_db.items())}
+            buf = json.dumps(snapshot, indent=2).encode()
+            h = hashlib.blake2b(buf, digest_size=8).digest()
+            if (self.crash_db_path, h) != self._last_db_hash:
+                # write-then-rename so a crash mid-write never corrupts the DB
+                tmp_path = self.crash_db_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(buf)
+                os.replace(tmp_path, self.crash_db_path)
+                self._last_db_hash = (self.crash_db_path, h)
+            open(self.crash_log_path, "w").close()
+            self._journal_count = 0
 
     def load_db(self):
         if not self.crash_db_path:
-            self.crash_db = {}
+            self.crash_db = OrderedDict()
             self.run_counter = 0
             return
 
         try:
             with open(self.crash_db_path, "r") as f:
-                self.crash_db = json.load(f)
-            # restore run_counter from existing keys
-            max_n = 0
-            for k in self.crash_db.keys():
-                if k.startswith("run_"):
+                self.crash_db = OrderedDict(_load_entries(json.load(f)))
+        except FileNotFoundError:
+            self.crash_db = OrderedDict()
+
+        # replay crashes journaled after the last snapshot
+        self._journal_count = 0
+        try:
+            with open(self.crash_log_path, "r") as f:
+                for l in f:
+                    self._journal_count += 1
                     try:
-                        n = int(k.split("_", 1)[1])
-                        max_n = max(max_n, n)
-                    except ValueError:
-                        pass
-            self.run_counter = max_n
+                        self.crash_db.update(_load_entries(json.loads(l)))
+                    except json.JSONDecodeError:
+                        pass  # torn final line
         except FileNotFoundError:
-            self.crash_db = {}
-            self.run_counter = 0
+            pass
+        if len(self.crash_db) > self.max_crashes:
+            # runs evicted in an earlier session are already archived
+            self._evict_old_crashes(skip=self._archived_run_ids())
+
+        # restore run_counter from existing keys
+        max_n = 0
+        for k in self.crash_db.keys():
+            if k.startswith("run_"):
+                try:
+                    n = int(k.split("_", 1)[1])
+                    max_n = max(max_n, n)
+                except ValueError:
+                    pass
+        self.run_counter = max_n
 
     # ---------------- Thread Loop ----------------
     def _thread_loop(self):
@@ -113,59 +269,175 @@ class SerialMonitor:
             self.running = False
             return
 
+        # Sleep in the kernel until the port is readable instead of polling
+        # readline(); the timeout only bounds how quickly stop() is noticed
+        ser.timeout = 0
+        fd = ser.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+
+        self._rxbuf = bytearray()
         while self.running:
             try:
-                line = ser.readline().decode(errors="ignore").rstrip()
-                if not line:
+                if not sel.select(timeout=0.2):
+                    # Port went idle: treat a pending partial line as complete
+                    # (the firmware often dies mid-line), like readline() did
+                    self._flush_rxbuf()
+                    self._flush_print(force=True)
                     continue
-                self._process_line(line)
-                if self.print_enabled:
-                    print(line)
+                try:
+                    data = os.read(fd, READ_CHUNK)
+                except BlockingIOError:
+                    continue  # spurious wakeup
+                if not data:
+                    raise serial.SerialException("port readable but returned no data")
+
+                if b"\n" in data:
+                    # Only copy when a partial line is pending from the last read
+                    if self._rxbuf:
+                        self._rxbuf += data
+                        data = bytes(self._rxbuf)
+                    *raw_lines, tail = data.split(b"\n")
+                    self._rxbuf.clear()
+                    self._rxbuf += tail
+                    self._handle_raw_lines(raw_lines)
+                else:
+                    self._rxbuf += data
+
+                # Garbled UART without newlines must not grow the buffer forever
+                if len(self._rxbuf) >= READ_CHUNK:
+                    self._flush_rxbuf()
+                self._flush_print()
             except Exception as e:
                 print(f"[SerialMonitor] Read error: {e}")
                 time.sleep(0.2)
 
+        self._flush_rxbuf()
+        self._flush_print(force=True)
+        sel.close()
         ser.close()
 
-    # ---------------- Crash Parsing Utils ----------------
-    def _extract_elr(self, crash):
-        for l in crash:
-            m = RE_ELR.search(l)
-            if m:
-                return m.group(1)
-        return None
-
-    def _extract_lr(self, crash):
-        for l in crash:
-            m = RE_LR.search(l)
-            if m:
-                return m.group(1)
-        return None
-
-    def _extract_esr(self, crash):
-        for l in crash:
-            m = RE_ESR.search(l)
-            if m:
-                return m.group(1)
-        return None
+    def _handle_raw_lines(self, raw_lines):
+        for raw in raw_lines:
+            line = raw.rstrip()
+            if not line:
+                continue
+            self._process_line(line)
+            if self.print_enabled:
+                self._print_pending.append(line)
+
+    def _flush_rxbuf(self):
+        # Process whatever partial line is pending as a complete line
+        if self._rxbuf:
+            raw = bytes(self._rxbuf)
+            self._rxbuf.clear()
+            self._handle_raw_lines([raw])
+
+    def _flush_print(self, force=False):
+        # Echo in batches: one stdout write per 64 lines or 50 ms
+        pending = self._print_pending
+        if not pending:
+            return
+        now = time.monotonic()
+        if not force and len(pending) < 64 and now - self._last_print_flush < 0.05:
+            return
+        self._print_pending = []
+        self._last_print_flush = now
+        sys.stdout.write(b"\n".join(pending).decode(errors="ignore") + "\n")
+        sys.stdout.flush()
+
+    def _writer_loop(self):
+        while True:
+            item = self._db_queue.get()
+            if item is None:
+                return
+            self._append_record(*item)
+
+    def _append_record(self, path, run_id, crash_entry):
+        if not path:
+            return
+        try:
+            with self._db_lock:
+                with open(path, "a") as f:
+                    f.write(json.dumps({run_id: crash_entry._asdict()}) + "\n")
+                if path == self.crash_log_path:
+                    self._journal_count += 1
+                compact = self._journal_count >= JOURNAL_COMPACT_EVERY
+            if compact:
+                self.save_db()
+        except OSError as e:
+            print(f"[SerialMonitor] Crash DB write error: {e}")
+
+    def _submit_record(self, path, run_id, crash_entry):
+        # Hand disk I/O to the writer thread when it runs; without one
+        # (offline use, before start()) write synchronously so nothing is lost
+        if self.writer is not None:
+            self._db_queue.put((path, run_id, crash_entry))
+        else:
+            self._append_record(path, run_id, crash_entry)
+
+    def _archived_run_ids(self):
+        ids = set()
+        try:
+            with open(self.crash_archive_path, "r") as f:
+                for l in f:
+                    try:
+                        ids.update(json.loads(l))
+                    except json.JSONDecodeError:
+                        pass  # torn final line
+        except FileNotFoundError:
+            pass
+        return ids
 
-    def _extract_code(self, crash):
+    # ---------------- Crash Parsing Utils ----------------
+    def _parse_code(self, l):
+        # Code: aaaaaaaa bbbbbbbb cccccccc dddddddd (eeeeeeee)
+        tokens = l[5:].replace("(", " ").replace(")", " ").split()
+        parts = [p for p in tokens if len(p) == 8 and HEX_DIGITS.issuperset(p)]
+        if not parts:
+            return None, None
+        prev = parts[:-1]
+        fault = parts[-1]
+        return prev, fault
+
+    def _extract_fields(self, crash):
+        # Single pass over the dump; the first occurrence of each field wins
+        elr = lr = esr = prev = fault = None
+        code_seen = False
         for l in crash:
-            if l.startswith("Code:"):
-                # Code: aaaaaaaa bbbbbbbb cccccccc dddddddd (eeeeeeee)
-                parts = re.findall(r"[0-9a-fA-F]{8}", l)
-                if not parts:
-                    return None, None
-                prev = parts[:-1]
-                fault = parts[-1]
-                return prev, fault
-        return None, None
+            if elr is None and "elr" in l:
+                elr = _field(l, "elr")
+            if lr is None and "lr" in l:
+                lr = _field(l, "lr")
+            if esr is None and "esr" in l:
+                m = RE_ESR.search(l)
+                if m:
+                    esr = m.group(1)
+            if not code_seen and l.startswith("Code:"):
+                code_seen = True
+                prev, fault = self._parse_code(l)
+        return elr, lr, esr, prev, fault
 
     # ---------------- Line Processor ----------------
-    def _process_line(self, line: str):
+    def _process_line(self, line: bytes):
+        # Cheap substring prefilter: almost every line is plain log output,
+        # so only hand candidate lines to the regex engine. CPU reset and
+        # crash start can fire in any state; boot finished only matters
+        # while booting (or before the first banner) outside a crash dump.
+        # Crash keywords are checked case-folded to match the (?i:...) group.
+        event = None
+        low = line.lower()
+        if (b"NOTICE:" in line or b"abort" in low
+                or b"exception" in low or b"undefined" in low
+                or (self.state != "running" and not self.crash_active
+                    and b"Starting application at" in line)):
+            m = RE_EVENTS.search(line)
+            if m:
+                event = m.lastgroup
 
         # ---------- 1. Detect CPU RESET ----------
-        if RE_CPU_RESET.search(line):
+        if event == "reset":
 
             # If crash ongoing, finalize partial crash
             if self.crash_active:
@@ -175,51 +447,57 @@ class SerialMonitor:
             self.run_counter += 1
             self.run_id = f"run_{self.run_counter}"
 
-            self.log_buffer.clear()
+            self._log_start = self._head
             self.state = "booting"
-            self.log_buffer.append(line)
+            self._logs[self._head % self.max_log] = line
+            self._head += 1
             return
 
         # Normal log storage
-        self.log_buffer.append(line)
+        self._logs[self._head % self.max_log] = line
+        self._head += 1
 
         # ---------- 2. Crash dump detection ----------
-        if RE_CRASH_START.search(line):
+        if event == "crash":
             self.crash_active = True
-            self.crash_temp = []
+            self.crash_temp.clear()
 
         if self.crash_active:
             self.crash_temp.append(line)
 
-            if RE_CRASH_END.search(line):
+            if _is_crash_end(line):
                 self._finalize_crash(complete=True)
             return
 
         # ---------- 3. Boot finished detection ----------
-        if RE_BOOT_FINISHED.search(line):
+        if event == "boot":
             self.state = "running"
 
     # ---------------- Crash Finalization ----------------
+    def _timestamp(self):
+        elapsed_us = (time.monotonic_ns() - self._t0_mono) // 1000
+        return (self._t0_wall + timedelta(microseconds=elapsed_us)).isoformat()
+
     def _finalize_crash(self, complete=True):
         self.crash_active = False
-        self.last_crash = list(self.crash_temp)
-
-        elr = self._extract_elr(self.crash_temp)
-        lr  = self._extract_lr(self.crash_temp)
-        esr = self._extract_esr(self.crash_temp)
-        prev_instrs, fault_instr = self._extract_code(self.crash_temp)
-
-        crash_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "run_id": self.run_id,
-            "complete": bool(complete),
-            "esr": esr if esr else None,
-            "elr": elr if elr else None,
-            "lr": lr if lr else None,
-            "prev_instructions": prev_instrs if prev_instrs else None,
-            "faulting_instruction": fault_instr if fault_instr else None,
-            "raw_dump": self.last_crash,
-        }
+        # Crash lines are captured as raw bytes; decode once, here
+        self.last_crash = [l.decode(errors="ignore") for l in self.crash_temp]
+        self.crash_temp.clear()
+
+        elr, lr, esr, prev_instrs, fault_instr = \
+            self._extract_fields(self.last_crash)
+
+        crash_entry = CrashEntry(
+            timestamp=self._timestamp(),
+            run_id=self.run_id,
+            complete=bool(complete),
+            esr=esr if esr else None,
+            elr=elr if elr else None,
+            lr=lr if lr else None,
+            prev_instructions=prev_instrs if prev_instrs else None,
+            faulting_instruction=fault_instr if fault_instr else None,
+            raw_dump=self.last_crash,
+        )
 
         if self.run_id is None:
             # fallback run_id if no boot banner seen yet
@@ -227,6 +505,15 @@ class SerialMonitor:
             self.run_id = f"run_{self.run_counter}"
 
         self.crash_db[self.run_id] = crash_entry
-        self.save_db()
+        self.crash_db.move_to_end(self.run_id)
+        # Disk I/O happens on the writer thread, never in the reader
+        self._submit_record(self.crash_log_path, self.run_id, crash_entry)
+        self._evict_old_crashes()
+
+    def _evict_old_crashes(self, skip=()):
+        # Keep the newest max_crashes runs in memory, archive the rest
+        while len(self.crash_db) > self.max_crashes:
+            run_id, crash_entry = self.crash_db.popitem(last=False)
+            if run_id not in skip:
+                self._submit_record(self.crash_archive_path, run_id, crash_entry)
 
-        self.crash_temp = []
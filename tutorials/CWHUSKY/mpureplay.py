@@ -0,0 +1,125 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Offline replay of stored SerialMonitor logs. Kept out of mpumonitor so the
+# live monitor does not depend on numpy/numba.
+
+# Event codes returned by classify_lines_bulk()
+EVENT_NONE, EVENT_RESET, EVENT_BOOT, EVENT_CRASH, EVENT_END = range(5)
+
+NOTICE = b"NOTICE:"
+CPU = b"STM32MP257FAI"
+BOOT = b"## Starting application at 0x88000040"
+CODE = b"Code: "
+# Matched case-insensitively, like the live monitor's (?i:...) crash group
+CRASH_KEYWORDS = (b"synchronous abort", b"undefined instruction", b"exception")
+
+
+def _classify_py(lines):
+    # Fallback without numba: the C-level bytes methods beat a per-byte loop
+    out = []
+    for l in lines:
+        if l.startswith(NOTICE) and CPU in l:
+            out.append(EVENT_RESET)
+        elif l.startswith(BOOT):
+            out.append(EVENT_BOOT)
+        else:
+            low = l.lower()
+            if CRASH_KEYWORDS[0] in low or CRASH_KEYWORDS[1] in low or \
+                    CRASH_KEYWORDS[2] in low:
+                out.append(EVENT_CRASH)
+            elif l.startswith(CODE):
+                out.append(EVENT_END)
+            else:
+                out.append(EVENT_NONE)
+    return np.array(out, dtype=np.int8)
+
+
+if njit is not None:
+
+    def _pattern(s):
+        return np.frombuffer(s, dtype=np.uint8)
+
+    PAT_NOTICE = _pattern(NOTICE)
+    PAT_CPU = _pattern(CPU)
+    PAT_BOOT = _pattern(BOOT)
+    PAT_CODE = _pattern(CODE)
+    PAT_ABORT, PAT_UNDEF, PAT_EXC = (_pattern(k) for k in CRASH_KEYWORDS)
+
+    @njit(cache=True)
+    def _starts_with(buf, start, end, pat):
+        n = pat.shape[0]
+        if end - start < n:
+            return False
+        for j in range(n):
+            if buf[start + j] != pat[j]:
+                return False
+        return True
+
+    @njit(cache=True)
+    def _contains(buf, start, end, pat):
+        for i in range(start, end - pat.shape[0] + 1):
+            if _starts_with(buf, i, end, pat):
+                return True
+        return False
+
+    @njit(cache=True)
+    def _contains_ci(buf, start, end, pat):
+        # pat is lowercase; fold ASCII uppercase in buf while comparing
+        n = pat.shape[0]
+        for i in range(start, end - n + 1):
+            for j in range(n):
+                c = buf[i + j]
+                if 65 <= c <= 90:
+                    c += 32
+                if c != pat[j]:
+                    break
+            else:
+                return True
+        return False
+
+    @njit(cache=True)
+    def _classify_kernel(buf, offsets, out, notice, cpu, boot, code,
+                         abort, undef, exc):
+        for i in range(out.shape[0]):
+            start = offsets[i]
+            end = offsets[i + 1] - 1  # drop the joining newline
+            if _starts_with(buf, start, end, notice) and \
+                    _contains(buf, start, end, cpu):
+                out[i] = EVENT_RESET
+            elif _starts_with(buf, start, end, boot):
+                out[i] = EVENT_BOOT
+            elif _contains_ci(buf, start, end, abort) or \
+                    _contains_ci(buf, start, end, undef) or \
+                    _contains_ci(buf, start, end, exc):
+                out[i] = EVENT_CRASH
+            elif _starts_with(buf, start, end, code):
+                out[i] = EVENT_END
+            else:
+                out[i] = EVENT_NONE
+
+
+def classify_lines_bulk(lines):
+    """Classify stored serial lines (bytes) for offline log replay.
+
+    Returns an int8 array with one EVENT_* code per line. This is a
+    stateless counterpart of the live prefilter in
+    SerialMonitor._process_line that uses literal byte matches only. With
+    numba installed the scan runs as a JIT-compiled kernel over one joined
+    buffer; otherwise it falls back to plain bytes methods.
+    """
+    if njit is None:
+        return _classify_py(lines)
+    out = np.zeros(len(lines), dtype=np.int8)
+    if not lines:
+        return out
+    buf = np.frombuffer(b"\n".join(lines) + b"\n", dtype=np.uint8)
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(l) + 1 for l in lines], out=offsets[1:])
+    _classify_kernel(buf, offsets, out, PAT_NOTICE, PAT_CPU, PAT_BOOT,
+                     PAT_CODE, PAT_ABORT, PAT_UNDEF, PAT_EXC)
+    return out